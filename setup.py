@@ -32,6 +32,10 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=requirements,
+    extras_require={
+        "simd": ["simsimd"],
+        "faiss": ["faiss-cpu"],
+    },
     entry_points={
         "console_scripts": [
             "rag-system=main:main",
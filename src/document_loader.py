@@ -1,8 +1,16 @@
 import os
 from typing import List, Dict, Any
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from pypdf import PdfReader
 
+# Below this many files, process pool startup costs more than it saves
+MIN_DOCS_FOR_MULTIPROCESSING = 8
+
+def _load_document_in_worker(file_path: Path) -> Dict[str, Any]:
+    """Load a single document in a worker process"""
+    return DocumentLoader(file_path.parent)._load_single_document(file_path)
+
 class DocumentLoader:
     def __init__(self, data_dir: str):
         self.data_dir = Path(data_dir)
@@ -10,15 +18,23 @@ class DocumentLoader:
 
     def load_documents(self) -> List[Dict[str,Any]]:
         """Load all supported documents from data directory"""
-        documents=[]
+        file_paths = [
+            file_path for file_path in self.data_dir.rglob('*')
+            if file_path.suffix.lower() in self.supported_extensions
+        ]
 
-        for file_path in self.data_dir.rglob('*'):
-            if file_path.suffix.lower() in self.supported_extensions:
-                doc = self._load_single_document(file_path)
-                if doc:
-                    documents.append(doc)
+        # Text extraction is CPU-bound, so spread larger collections across processes
+        if len(file_paths) >= MIN_DOCS_FOR_MULTIPROCESSING:
+            try:
+                with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+                    documents = list(executor.map(_load_document_in_worker, file_paths, chunksize=4))
+            except Exception as e:
+                print(f"Warning: Parallel loading failed ({e}), loading documents sequentially")
+                documents = [self._load_single_document(file_path) for file_path in file_paths]
+        else:
+            documents = [self._load_single_document(file_path) for file_path in file_paths]
         
-        return documents
+        return [doc for doc in documents if doc]
     
     def _load_single_document(self, file_path: Path) -> Dict[str, Any]:
         """Load a single document based on its extension"""
@@ -52,13 +68,15 @@ class DocumentLoader:
         """Load a PDF file using pypdf"""
         try:
             reader = PdfReader(file_path)
-            content = ""
+            parts = []
             
             # Extract text from all pages
             for page_num, page in enumerate(reader.pages):
                 page_text = page.extract_text()
                 if page_text:
-                    content += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
+                    parts.append(f"\n--- Page {page_num + 1} ---\n{page_text}\n")
+            
+            content = "".join(parts)
             
             if not content.strip():
                 print(f"Warning: No text extracted from PDF {file_path}")
@@ -83,12 +101,9 @@ class DocumentLoader:
         try:
             from docx import Document
             doc = Document(file_path)
-            content = ""
             
             # Extract text from all paragraphs
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    content += paragraph.text + "\n"
+            content = "\n".join(p.text for p in doc.paragraphs if p.text.strip())
             
             if not content.strip():
                 print(f"Warning: No text extracted from DOCX {file_path}")
@@ -0,0 +1,49 @@
+import sqlite3
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+
+class EmbeddingCache:
+    """Persistent embedding cache in SQLite, keyed on a hash of model and text"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, dim INT, vec BLOB)"
+        )
+        self.conn.commit()
+
+    def get(self, sha: str) -> Optional[List[float]]:
+        """Return the cached embedding for a hash, or None"""
+        row = self.conn.execute("SELECT vec FROM embeddings WHERE hash = ?", (sha,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def get_many(self, shas: List[str]) -> List[Optional[List[float]]]:
+        """Return the cached embeddings for a list of hashes, with None for misses"""
+        found = {}
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(shas), 500):
+            batch = shas[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT hash, vec FROM embeddings WHERE hash IN ({placeholders})", batch
+            )
+            for sha, vec in rows:
+                found[sha] = np.frombuffer(vec, dtype=np.float32).tolist()
+        return [found.get(sha) for sha in shas]
+
+    def put(self, sha: str, embedding: List[float]):
+        """Store an embedding under a hash"""
+        self.put_many([sha], [embedding])
+
+    def put_many(self, shas: List[str], embeddings: List[List[float]]):
+        """Store several embeddings in a single transaction"""
+        rows = []
+        for sha, embedding in zip(shas, embeddings):
+            vec = np.asarray(embedding, dtype=np.float32)
+            rows.append((sha, len(vec), vec.tobytes()))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
@@ -1,52 +1,242 @@
 import os
+import time
+import hashlib
+import random
+import asyncio
+import itertools
 from typing import List, Dict, Any
-from openai import OpenAI
-import numpy as np
+from openai import OpenAI, AsyncOpenAI, BadRequestError, RateLimitError, APIConnectionError, InternalServerError
 from dotenv import load_dotenv
+from similarity import cosine_similarity
+from embedding_cache import EmbeddingCache
+from tokenizer import CHARS_PER_TOKEN, load_encoding
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Maximum number of texts sent in one embeddings request
+BATCH_SIZE = 256
+# Per-input token limit of the embedding model, and an upper bound for a whole request
+MAX_INPUT_TOKENS = 8192
+MAX_BATCH_TOKENS = 300000
+# Rate limits and server errors are retried up to MAX_RETRIES times with exponential
+# backoff, or as long as the server's Retry-After header asks. Connection errors
+# usually mean the API is unreachable, so they are retried at most
+# MAX_CONNECTION_RETRIES times. Embedding a single query uses the smaller
+# QUERY_MAX_RETRIES budget so interactive questions fail fast.
+MAX_RETRIES = 5
+MAX_CONNECTION_RETRIES = 1
+QUERY_MAX_RETRIES = 1
+RETRY_BASE_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+# Maximum number of embeddings requests in flight at once, and the random
+# delay added before each one so they don't all hit the rate limit together
+MAX_INFLIGHT = 8
+MAX_JITTER = 0.25
+# Where embeddings are cached between runs; set to an empty string to disable
+DEFAULT_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', '.cache/embeddings.sqlite')
+
+def _retry_delay(error: Exception, attempt: int, max_retries: int):
+    """Seconds to wait before retrying a failed embeddings request, or None to give up"""
+    if not isinstance(error, (RateLimitError, APIConnectionError, InternalServerError)):
+        return None
+    if isinstance(error, APIConnectionError):
+        max_retries = min(max_retries, MAX_CONNECTION_RETRIES)
+    if attempt >= max_retries:
+        return None
+
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if 'retry-after-ms' in headers:
+            return min(float(headers['retry-after-ms']) / 1000, MAX_RETRY_DELAY)
+        if 'retry-after' in headers:
+            return min(float(headers['retry-after']), MAX_RETRY_DELAY)
+    except ValueError:
+        pass  # An HTTP date rather than seconds; use our own backoff
+    return RETRY_BASE_DELAY * (2 ** attempt)
+
 class EmbeddingSystem:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, batch_size: int = BATCH_SIZE, cache_path: str = DEFAULT_CACHE_PATH):
         api_key_to_use = api_key or os.getenv('OPENAI_API_KEY')
         print(f"Debug: Using API key: {api_key_to_use[:20] if api_key_to_use else 'None'}...")
+        self.api_key = api_key_to_use
         self.client = OpenAI(api_key=api_key_to_use)
+        # Embedding requests do their own retries (see _embed_batch), so turn
+        # off the SDK's built-in ones to keep a single backoff budget
+        self._embedding_client = self.client.with_options(max_retries=0)
         self.model = "text-embedding-ada-002"
+        self.batch_size = batch_size
+        self._enc = load_encoding(self.model)
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
     
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of texts"""
-        embeddings = []
-        
-        for text in texts:
-            embedding = self._generate_single_embedding(text)
-            if embedding:
-                embeddings.append(embedding)
-        
+    def generate_embeddings(self, texts: List[str], max_retries: int = MAX_RETRIES) -> List[List[float]]:
+        """Generate embeddings for a list of texts, one API call per batch.
+
+        The result is aligned with `texts`; texts that could not be embedded get None.
+        """
+        embeddings, missing = self._get_cached_embeddings(texts)
+
+        for batch in self._make_batches(texts, missing):
+            batch_embeddings = self._generate_batch_embeddings([texts[i] for i in batch], max_retries)
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+
+        self._cache_embeddings(texts, embeddings, missing)
         return embeddings
-    
-    def _generate_single_embedding(self, text: str) -> List[float]:
-        """Generate embedding for a single text"""
+
+    def _cache_key(self, text: str) -> str:
+        """Hash of the model and text, so changing either misses the cache"""
+        return hashlib.sha256(f"{self.model}\n{text}".encode()).hexdigest()
+
+    def _get_cached_embeddings(self, texts: List[str]):
+        """Look up texts in the cache, returning the embeddings and the indices of the misses"""
+        if self.cache is None:
+            return [None] * len(texts), list(range(len(texts)))
+
+        embeddings = self.cache.get_many([self._cache_key(text) for text in texts])
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if len(missing) < len(texts):
+            print(f"Found {len(texts) - len(missing)} of {len(texts)} embeddings in cache")
+        return embeddings, missing
+
+    def _cache_embeddings(self, texts: List[str], embeddings: List[List[float]], indices: List[int]):
+        """Store newly generated embeddings in the cache"""
+        if self.cache is None:
+            return
+
+        indices = [i for i in indices if embeddings[i]]
+        if indices:
+            self.cache.put_many([self._cache_key(texts[i]) for i in indices], [embeddings[i] for i in indices])
+
+    def _count_tokens(self, text: str) -> int:
+        """Count the tokens of a text with the model's encoding, or estimate them from its length"""
+        if self._enc is not None:
+            return len(self._enc.encode_ordinary(text))
+        return len(text) // CHARS_PER_TOKEN + 1
+
+    def _make_batches(self, texts: List[str], indices: List[int]) -> List[List[int]]:
+        """Group the given text indices into batches that respect the API's input limits"""
+        batches = []
+        batch = []
+        batch_tokens = 0
+
+        for i in indices:
+            text = texts[i]
+            if not text.strip():
+                continue
+            tokens = self._count_tokens(text)
+            if tokens > MAX_INPUT_TOKENS:
+                print(f"Warning: Skipping text {i}, too long to embed ({tokens} tokens)")
+                continue
+
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > MAX_BATCH_TOKENS):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+
+            batch.append(i)
+            batch_tokens += tokens
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _embed_batch(self, texts: List[str], max_retries: int):
+        """Drive the requests for one batch of texts, shared by the sync and async paths.
+
+        A generator doing no I/O itself: it yields (texts, delay), the caller waits
+        delay seconds, sends texts to the embeddings endpoint and sends back the
+        response or the exception raised. Transient failures are retried (see
+        _retry_delay) and a batch rejected as invalid is bisected. Returns the
+        embeddings aligned with texts, None for texts that could not be embedded.
+        """
+        delay = 0.0
+        for attempt in itertools.count():
+            result = yield texts, delay
+            if not isinstance(result, Exception):
+                return [d.embedding for d in sorted(result.data, key=lambda d: d.index)]
+
+            if isinstance(result, BadRequestError):
+                if len(texts) == 1:
+                    print(f"Error generating embedding: {result}")
+                    return [None]
+                # One bad input rejects the whole request; split it so the rest still get embedded
+                mid = len(texts) // 2
+                return ((yield from self._embed_batch(texts[:mid], max_retries))
+                        + (yield from self._embed_batch(texts[mid:], max_retries)))
+
+            delay = _retry_delay(result, attempt, max_retries)
+            if delay is None:
+                print(f"Error generating embeddings: {result}")
+                return [None] * len(texts)
+            print(f"Warning: Embedding request failed ({result}), retrying in {delay:.1f}s...")
+
+    def _generate_batch_embeddings(self, texts: List[str], max_retries: int = MAX_RETRIES) -> List[List[float]]:
+        """Generate embeddings for a batch of texts (see _embed_batch)"""
+        steps = self._embed_batch(texts, max_retries)
+        request, delay = next(steps)
+        while True:
+            if delay:
+                time.sleep(delay)
+            try:
+                result = self._embedding_client.embeddings.create(model=self.model, input=request)
+            except Exception as e:
+                result = e
+            try:
+                request, delay = steps.send(result)
+            except StopIteration as done:
+                return done.value
+
+    def generate_embeddings_concurrently(self, texts: List[str]) -> List[List[float]]:
+        """Synchronous wrapper around agenerate_embeddings.
+
+        asyncio.run() can't be used inside a running event loop (Jupyter, async web
+        handlers); there the batches are sent one at a time with generate_embeddings.
+        """
         try:
-            response = self.client.embeddings.create(
-                model=self.model,
-                input=text
-            )
-            return response.data[0].embedding
-        except Exception as e:
-            print(f"Error generating embedding: {e}")
-            return None
-    
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.agenerate_embeddings(texts))
+        return self.generate_embeddings(texts)
+
+    async def agenerate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a list of texts, sending the batches concurrently.
+
+        The result is aligned with `texts`; texts that could not be embedded get None.
+        """
+        embeddings, missing = self._get_cached_embeddings(texts)
+        semaphore = asyncio.Semaphore(MAX_INFLIGHT)
+
+        async with AsyncOpenAI(api_key=self.api_key, max_retries=0) as client:
+            async def embed_batch(batch: List[int]):
+                async with semaphore:
+                    await asyncio.sleep(random.uniform(0, MAX_JITTER))
+                    batch_embeddings = await self._agenerate_batch_embeddings(client, [texts[i] for i in batch])
+                for i, embedding in zip(batch, batch_embeddings):
+                    embeddings[i] = embedding
+
+            await asyncio.gather(*[embed_batch(batch) for batch in self._make_batches(texts, missing)])
+
+        self._cache_embeddings(texts, embeddings, missing)
+        return embeddings
+
+    async def _agenerate_batch_embeddings(self, client: AsyncOpenAI, texts: List[str]) -> List[List[float]]:
+        """Async version of _generate_batch_embeddings"""
+        steps = self._embed_batch(texts, MAX_RETRIES)
+        request, delay = next(steps)
+        while True:
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                result = await client.embeddings.create(model=self.model, input=request)
+            except Exception as e:
+                result = e
+            try:
+                request, delay = steps.send(result)
+            except StopIteration as done:
+                return done.value
+
     def cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """Calculate cosine similarity between two vectors"""
-        vec1 = np.array(vec1)
-        vec2 = np.array(vec2)
-        
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
-        
-        if norm1 == 0 or norm2 == 0:
-            return 0
-        
-        return dot_product / (norm1 * norm2)
\ No newline at end of file
+        return cosine_similarity(vec1, vec2)
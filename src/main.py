@@ -36,7 +36,7 @@ def main():
                 print(f"\n📚 SOURCES ({len(result['sources'])} chunks found):")
                 for i, source in enumerate(result['sources'], 1):
                     print(f"\n--- Source {i} ---")
-                    print(f"File: {source['source']}")
+                    print(f"File: {', '.join(source['sources'])}")
                     if 'similarity' in source:
                         print(f"Similarity: {source['similarity']:.3f}")
                     print(f"Content: {source['content'][:150]}...")
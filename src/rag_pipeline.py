@@ -1,24 +1,69 @@
 import os
-from typing import List, Dict, Any
+import re
+import time
+import heapq
+from typing import List, Dict, Any, Tuple
+import numpy as np
 from dotenv import load_dotenv
 from document_loader import DocumentLoader
 from text_chunker import TextChunker
-from embedding_system import EmbeddingSystem
+from embedding_system import EmbeddingSystem, QUERY_MAX_RETRIES
 from vector_store import SimpleVectorStore
+from similarity import cosine_similarities, normalize
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Set DEBUG=1 to print search diagnostics
+DEBUG = os.getenv('DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# Chat completion settings used to generate answers
+CHAT_MODEL = os.getenv('CHAT_MODEL', 'gpt-3.5-turbo')
+CHAT_TEMPERATURE = float(os.getenv('CHAT_TEMPERATURE', '0.3'))
+CHAT_MAX_TOKENS = int(os.getenv('CHAT_MAX_TOKENS', '500'))
+
+# Set DEDUP_THRESHOLD (e.g. 0.95) to merge chunks whose embeddings are more similar
+# than this into one chunk listing all their sources; off by default
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD')) if os.getenv('DEDUP_THRESHOLD') else None
+
+SYSTEM_MESSAGE = {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context."}
+
+PROMPT_TEMPLATE = """Based on the following information, provide a comprehensive and accurate answer to the question.
+
+Context Information:
+{context}
+
+Question: {question}
+
+Instructions:
+- Use only the information provided in the context
+- If the context doesn't contain enough information to fully answer the question, say so
+- Provide a clear, well-structured answer
+- Cite the sources when possible
+
+Answer:"""
+
 class RAGPipeline:
-    def __init__(self, data_dir: str, api_key: str = None):
+    def __init__(self, data_dir: str, api_key: str = None, cache_threshold: float = 0.95,
+                 cache_ttl: float = 300, cache_maxsize: int = 1000, dedup_threshold: float = DEDUP_THRESHOLD):
         self.document_loader = DocumentLoader(data_dir)
         self.text_chunker = TextChunker()
         self.embedding_system = EmbeddingSystem(api_key)
-        self.vector_store = SimpleVectorStore()
+        # Share the embedding client so chat requests reuse its connection pool
+        self._chat_client = self.embedding_system.client
+        self.vector_store = SimpleVectorStore(dedup_threshold=dedup_threshold)
         self.is_initialized = False
+        # Semantic query cache: a question whose embedding is at least cache_threshold
+        # similar to a recently answered one reuses that answer. Entries are
+        # [normalized embedding, top_k, result, insert time], least recently used first.
+        self.cache_threshold = cache_threshold
+        self.cache_ttl = cache_ttl
+        self.cache_maxsize = cache_maxsize
+        self._qcache = []
     
     def initialize(self):
         """Initialize the RAG system by loading and processing documents"""
+        self._qcache = []
         print("Loading documents...")
         documents = self.document_loader.load_documents()
         
@@ -27,7 +72,7 @@ class RAGPipeline:
         
         print("Generating embeddings...")
         chunk_texts = [chunk['content'] for chunk in chunks]
-        embeddings = self.embedding_system.generate_embeddings(chunk_texts)
+        embeddings = self.embedding_system.generate_embeddings_concurrently(chunk_texts)
         
         # Filter out chunks that failed to get embeddings
         valid_chunks = []
@@ -51,15 +96,17 @@ class RAGPipeline:
         self.vector_store.add_chunks(valid_chunks, valid_embeddings)
         
         self.is_initialized = True
-        print(f"RAG system initialized with {len(valid_chunks)} chunks")
+        print(f"RAG system initialized with {len(self.vector_store.chunks)} chunks")
     
     def query(self, question: str, top_k: int = 5) -> Dict[str, Any]:
         """Query the RAG system and return generated response"""
         if not self.is_initialized:
             raise ValueError("RAG system not initialized. Call initialize() first.")
         
-        # Try to generate embedding for the question
-        question_embeddings = self.embedding_system.generate_embeddings([question])
+        # Try to generate embedding for the question, with a small retry budget so an
+        # unreachable API falls back to text search quickly
+        question_embeddings = self.embedding_system.generate_embeddings([question], max_retries=QUERY_MAX_RETRIES)
+        question_embedding = None
         
         if not question_embeddings or len(question_embeddings) == 0:
             print("Warning: Could not generate embedding. Using basic text search.")
@@ -71,115 +118,144 @@ class RAGPipeline:
                 print("Warning: Invalid embedding generated. Using basic text search.")
                 retrieved_chunks = self._basic_text_search(question, top_k)
             else:
+                cached = self._lookup_query_cache(question_embedding, top_k)
+                if cached is not None:
+                    return {**cached, 'question': question}
+                
                 # Search for relevant chunks using embeddings
                 search_results = self.vector_store.search(question_embedding, top_k)
-                retrieved_chunks = [
-                    {
-                        'chunk': chunk,
-                        'similarity': score,
-                        'content': chunk['content'],
-                        'source': chunk['source']
-                    }
-                    for chunk, score in search_results
-                ]
+                retrieved_chunks = [self._retrieved_chunk(chunk, score) for chunk, score in search_results]
+                
+                # The store has no embeddings in basic mode; fall back to keyword matching
+                if not retrieved_chunks:
+                    retrieved_chunks = self._basic_text_search(question, top_k)
         
         # Generate response using retrieved chunks
-        generated_response = self.generate_response(question, retrieved_chunks)
+        generated_response, from_llm = self._generate_response(question, retrieved_chunks)
         
         # Return both the response and the source chunks
-        return {
+        result = {
             'response': generated_response,
             'sources': retrieved_chunks,
             'question': question
         }
+        
+        # Only cache real answers, not the fallback served while the LLM is unavailable
+        if question_embedding and from_llm:
+            self._store_query_cache(question_embedding, top_k, result)
+        
+        return result
+    
+    def _lookup_query_cache(self, question_embedding: List[float], top_k: int) -> Dict[str, Any]:
+        """Return a cached result for a semantically equivalent question, or None"""
+        now = time.monotonic()
+        self._qcache = [entry for entry in self._qcache if now - entry[3] < self.cache_ttl]
+        
+        candidates = [i for i, entry in enumerate(self._qcache) if entry[1] == top_k]
+        if not candidates:
+            return None
+        
+        q = normalize(question_embedding)
+        similarities = cosine_similarities(q, np.stack([self._qcache[i][0] for i in candidates]))
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.cache_threshold:
+            return None
+        
+        # Move the hit to the end so the least recently used entry is evicted first
+        entry = self._qcache.pop(candidates[best])
+        self._qcache.append(entry)
+        return entry[2]
+    
+    def _store_query_cache(self, question_embedding: List[float], top_k: int, result: Dict[str, Any]):
+        """Add a query result to the semantic cache"""
+        self._qcache.append([normalize(question_embedding), top_k, result, time.monotonic()])
+        if len(self._qcache) > self.cache_maxsize:
+            self._qcache.pop(0)
     
     def _basic_text_search(self, question: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """Basic text search when embeddings are not available"""
         question_lower = question.lower()
-        results = []
-        
-        print(f"Debug: Searching through {len(self.vector_store.chunks)} chunks")
-        print(f"Debug: Question: '{question}' (lowercase: '{question_lower}')")
-        
-        for i, chunk in enumerate(self.vector_store.chunks):
-            content_lower = chunk['content'].lower()
-            print(f"Debug: Chunk {i}: '{chunk['content'][:100]}...'")
-            
-            # Simple keyword matching
+        words = question_lower.split()
+        if not words:
+            return []
+
+        if DEBUG:
+            print(f"Debug: Searching through {len(self.vector_store.chunks)} chunks")
+            print(f"Debug: Question: '{question}' (lowercase: '{question_lower}')")
+
+        # Exact matches are found with a substring test; a compiled alternation counts
+        # the word hits in one pass. findall doesn't return overlapping matches, so the
+        # whole question can't be an alternative: an earlier word hit could consume it.
+        pattern = re.compile("|".join(map(re.escape, words)))
+
+        scored = []
+        for i, content_lower in enumerate(self.vector_store.content_lower):
             if question_lower in content_lower:
-                print(f"Debug: Found exact match in chunk {i}")
-                results.append({
-                    'chunk': chunk,
-                    'similarity': 1.0,  # High similarity for exact matches
-                    'content': chunk['content'],
-                    'source': chunk['source']
-                })
-            elif any(word in content_lower for word in question_lower.split()):
-                print(f"Debug: Found partial match in chunk {i}")
-                results.append({
-                    'chunk': chunk,
-                    'similarity': 0.5,  # Medium similarity for partial matches
-                    'content': chunk['content'],
-                    'source': chunk['source']
-                })
-        
-        print(f"Debug: Found {len(results)} results")
-        # Sort by similarity and return top_k results
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-        return results[:top_k]
+                similarity = 1.0  # High similarity for exact matches
+            else:
+                hits = len(pattern.findall(content_lower))
+                if not hits:
+                    continue
+                # Partial matches score by the number of word hits, but stay below exact matches
+                similarity = min(0.1 * hits, 0.9)
+            scored.append((similarity, i))
+
+        if DEBUG:
+            print(f"Debug: Found {len(scored)} results")
+
+        return [
+            self._retrieved_chunk(self.vector_store.chunks[i], similarity)
+            for similarity, i in heapq.nlargest(top_k, scored, key=lambda x: x[0])
+        ]
+    
+    def _retrieved_chunk(self, chunk: Dict[str, Any], similarity: float) -> Dict[str, Any]:
+        """Describe a retrieved chunk; 'sources' also lists the sources of duplicates merged into it"""
+        return {
+            'chunk': chunk,
+            'similarity': similarity,
+            'content': chunk['content'],
+            'source': chunk['source'],
+            'sources': chunk.get('sources', [chunk['source']])
+        }
     
     def generate_response(self, question: str, retrieved_chunks: List[Dict[str, Any]]) -> str:
         """Generate a coherent answer using retrieved context and LLM"""
+        return self._generate_response(question, retrieved_chunks)[0]
+    
+    def _generate_response(self, question: str, retrieved_chunks: List[Dict[str, Any]]) -> Tuple[str, bool]:
+        """Generate a response, also returning whether it came from the LLM"""
         if not retrieved_chunks:
-            return "I couldn't find any relevant information to answer your question."
+            return "I couldn't find any relevant information to answer your question.", False
         
         # Format the context from retrieved chunks
-        context_parts = []
-        for i, result in enumerate(retrieved_chunks, 1):
-            chunk = result['chunk']
-            context_parts.append(f"Source {i} ({chunk['source']}):\n{chunk['content']}")
-        
-        context = "\n\n".join(context_parts)
+        context = "\n\n".join([
+            f"Source {i} ({', '.join(result['sources'])}):\n{result['content']}"
+            for i, result in enumerate(retrieved_chunks, 1)
+        ])
         
         # Create the prompt for the LLM
-        prompt = f"""Based on the following information, provide a comprehensive and accurate answer to the question.
-
-Context Information:
-{context}
-
-Question: {question}
-
-Instructions:
-- Use only the information provided in the context
-- If the context doesn't contain enough information to fully answer the question, say so
-- Provide a clear, well-structured answer
-- Cite the sources when possible
-
-Answer:"""
+        prompt = PROMPT_TEMPLATE.format(context=context, question=question)
         
         # Try to generate response using OpenAI
         try:
             response = self._generate_with_openai(prompt)
-            return response
+            return response, True
         except Exception as e:
             print(f"Error generating response with OpenAI: {e}")
             # Fallback to basic response formatting
-            return self._format_basic_response(question, retrieved_chunks)
+            return self._format_basic_response(question, retrieved_chunks), False
     
     def _generate_with_openai(self, prompt: str) -> str:
         """Generate response using OpenAI API"""
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = self._chat_client.chat.completions.create(
+                model=CHAT_MODEL,
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context."},
+                    SYSTEM_MESSAGE,
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=500,
-                temperature=0.3
+                max_tokens=CHAT_MAX_TOKENS,
+                temperature=CHAT_TEMPERATURE
             )
             
             return response.choices[0].message.content.strip()
@@ -195,8 +271,7 @@ Answer:"""
         response = f"Based on the available information, here's what I found about '{question}':\n\n"
         
         for i, result in enumerate(retrieved_chunks, 1):
-            chunk = result['chunk']
-            response += f"{i}. From {chunk['source']}:\n{chunk['content']}\n\n"
+            response += f"{i}. From {', '.join(result['sources'])}:\n{result['content']}\n\n"
         
         response += "Note: This is a basic summary. For a more coherent answer, please ensure your OpenAI API key is configured."
         return response
\ No newline at end of file
@@ -0,0 +1,72 @@
+from typing import List
+import numpy as np
+
+# SimSIMD is optional; fall back to NumPy when it is not installed
+try:
+    import simsimd
+    _HAS_SIMSIMD = True
+except ImportError:
+    simsimd = None
+    _HAS_SIMSIMD = False
+
+def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
+    """Calculate cosine similarity between two vectors"""
+    vec1 = np.asarray(vec1, dtype=np.float32)
+    vec2 = np.asarray(vec2, dtype=np.float32)
+
+    if not vec1.any() or not vec2.any():
+        return 0.0
+
+    if _HAS_SIMSIMD:
+        return 1.0 - float(simsimd.cosine(vec1, vec2))
+
+    return float(np.dot(vec1, vec2) / np.sqrt(np.dot(vec1, vec1) * np.dot(vec2, vec2)))
+
+def normalize(vector: List[float]) -> np.ndarray:
+    """Return a vector scaled to unit L2 norm as float32; zero vectors stay zero"""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.sqrt(vector @ vector))
+    return vector / norm if norm else vector
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale every row of a float32 matrix to unit L2 norm in place; zero rows stay zero"""
+    norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))
+    norms[norms == 0] = 1.0
+    matrix /= norms[:, None]
+    return matrix
+
+def cosine_similarities(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Calculate cosine similarity between a normalized query and every row of a normalized matrix"""
+    if _HAS_SIMSIMD:
+        return 1.0 - np.asarray(simsimd.cdist(query[None, :], matrix, metric="cosine")).ravel()
+
+    # Rows are pre-normalized, so cosine similarity is a single matrix-vector product
+    return matrix @ query
+
+def quantize_int8(vectors: np.ndarray):
+    """Quantize float vectors (one per row) to int8, returning the codes and per-row scales"""
+    vectors = np.atleast_2d(vectors)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def int8_cosine_similarities(query: np.ndarray, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Approximate cosine similarity between a normalized query and int8-quantized normalized rows.
+
+    Requires SimSIMD, which uses integer dot-product instructions (VNNI on x86, SDOT on ARM).
+    """
+    query_codes, query_scale = quantize_int8(query)
+    dots = np.asarray(simsimd.cdist(query_codes, codes, metric="dot")).ravel()
+    return dots * (query_scale[0] * scales)
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the k highest scores, best first.
+
+    Uses argpartition, so only the k selected scores are sorted.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
@@ -1,9 +1,19 @@
+import re
+import bisect
 from typing import List, Dict, Any
+from tokenizer import CHARS_PER_TOKEN, load_encoding
 
 class TextChunker:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 100, model: str = "text-embedding-ada-002"):
+        """Split documents into chunks of at most chunk_size tokens, as counted by the embedding model.
+
+        If the model's encoding can't be loaded, sizes are converted to characters instead.
+        """
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap must be non-negative and smaller than chunk_size")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self._enc = load_encoding(model)
     
     def split_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Split documents into chunks"""
@@ -19,38 +29,58 @@ class TextChunker:
         """Split a single document into chunks"""
         content = document['content']
         chunks = []
+
+        if self._enc is not None:
+            # Encode once; offsets[i] is the character position where token i starts
+            ids = self._enc.encode(content, disallowed_special=())
+            _, offsets = self._enc.decode_with_offsets(ids)
+            n_tokens = len(ids)
+            chunk_size, chunk_overlap = self.chunk_size, self.chunk_overlap
+        else:
+            # Without an encoding every character is a unit, and sizes are scaled to match
+            offsets = range(len(content))
+            n_tokens = len(content)
+            chunk_size = self.chunk_size * CHARS_PER_TOKEN
+            chunk_overlap = self.chunk_overlap * CHARS_PER_TOKEN
+
+        # Token positions just after each sentence-ending character, found in one pass
+        boundaries = sorted({bisect.bisect_left(offsets, m.end()) for m in re.finditer(r'[.!?]', content)})
         
         start = 0
-        while start < len(content):
-            end = start + self.chunk_size
+        prev_end = 0
+        while start < n_tokens:
+            end = start + chunk_size
             
             # If this isn't the last chunk, try to break at a sentence boundary
-            if end < len(content):
-                # Find the last sentence boundary within the chunk
-                last_period = content.rfind('.', start, end)
-                last_exclamation = content.rfind('!', start, end)
-                last_question = content.rfind('?', start, end)
-                
-                # Find the latest sentence boundary
-                sentence_end = max(last_period, last_exclamation, last_question)
-                
-                if sentence_end > start:
-                    end = sentence_end + 1
+            if end < n_tokens:
+                # Find the last sentence boundary within the chunk, past the end of
+                # the previous chunk so the overlap never yields a chunk twice
+                i = bisect.bisect_right(boundaries, end)
+                if i > 0 and boundaries[i - 1] > max(start, prev_end):
+                    end = boundaries[i - 1]
             
-            chunk_content = content[start:end].strip()
+            start_char = offsets[start]
+            end_char = offsets[end] if end < n_tokens else len(content)
+            chunk_content = content[start_char:end_char].strip()
             
             if chunk_content:
                 chunk = {
                     'content': chunk_content,
                     'source': document['source'],
                     'chunk_id': len(chunks),
-                    'start_char': start,
-                    'end_char': end,
+                    'start_char': start_char,
+                    'end_char': end_char,
                     'metadata': document.get('metadata', {})
                 }
                 chunks.append(chunk)
             
-            # Move start position, accounting for overlap
-            start = max(start + 1, end - self.chunk_overlap)
+            if end >= n_tokens:
+                break
+            prev_end = end
+            
+            # Move start position, accounting for overlap. A chunk cut short at a
+            # sentence boundary may be no longer than the overlap; don't step back then.
+            next_start = end - chunk_overlap
+            start = next_start if next_start > start else end
         
         return chunks
\ No newline at end of file
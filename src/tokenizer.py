@@ -0,0 +1,28 @@
+from functools import lru_cache
+
+# tiktoken is optional; without it token counts are estimated from characters
+try:
+    import tiktoken
+    _HAS_TIKTOKEN = True
+except ImportError:
+    tiktoken = None
+    _HAS_TIKTOKEN = False
+
+# Rough number of characters per token, used when no encoding is available
+CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=None)
+def load_encoding(model: str):
+    """Return the tiktoken encoding for a model, or None if it can't be loaded.
+
+    tiktoken downloads the encoding on first use, so this fails when offline.
+    The result is cached, so a failed load is only attempted and reported once.
+    """
+    if not _HAS_TIKTOKEN:
+        print("Warning: tiktoken is not installed, estimating token counts from characters")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        print(f"Warning: Could not load tiktoken encoding for {model} ({e}), estimating token counts from characters")
+        return None
@@ -1,64 +1,311 @@
+import os
+import pickle
+from pathlib import Path
 from typing import List, Dict, Any, Tuple
 import numpy as np
+from similarity import (_HAS_SIMSIMD, cosine_similarities, normalize, normalize_rows,
+                        quantize_int8, int8_cosine_similarities, top_k_indices)
+
+# FAISS is optional; without it every search is a brute-force scan
+try:
+    import faiss
+    _HAS_FAISS = True
+except ImportError:
+    faiss = None
+    _HAS_FAISS = False
+
+# Below FAISS_MIN_CHUNKS a plain scan of the matrix is fast enough. Up to
+# HNSW_MIN_CHUNKS searches stay exact with IndexFlatIP; beyond that an HNSW
+# graph trades a little recall for logarithmic search time.
+FAISS_MIN_CHUNKS = 10_000
+HNSW_MIN_CHUNKS = 50_000
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+
+# Rows are added to the FAISS index in blocks, bounding the float32 copy of a quantized matrix
+FAISS_ADD_BLOCK = 10_000
+
+# Deduplication compares rows in tiles of this many, bounding the similarity matrices
+DEDUP_BLOCK = 2048
+
+def _best_matches(row_blocks, block: np.ndarray):
+    """Best similarity, and the matching row index, of each row of block over consecutive row blocks"""
+    best = np.full(len(block), -np.inf, dtype=np.float32)
+    best_row = np.zeros(len(block), dtype=np.intp)
+    columns = np.arange(len(block))
+    offset = 0
+    for rows in row_blocks:
+        similarities = rows @ block.T
+        arg = similarities.argmax(axis=0)
+        top = similarities[arg, columns]
+        better = top > best
+        best[better] = top[better]
+        best_row[better] = arg[better] + offset
+        offset += len(rows)
+    return best, best_row
 
 class SimpleVectorStore:
-    def __init__(self):
-        self.embeddings = []
+    def __init__(self, quantize: bool = True, dedup_threshold: float = None):
+        # Store embeddings as int8 with a per-row scale, a quarter of the memory of
+        # float32. Only used with SimSIMD, which has fast int8 dot-product kernels.
+        self.quantize = quantize and _HAS_SIMSIMD
+        # A new chunk whose embedding is more similar than this (e.g. 0.95) to a stored
+        # one is merged into it instead of being added. Off (None) by default: the
+        # comparison is quadratic in the number of chunks, and related but distinct
+        # text-embedding-ada-002 chunks can score around 0.95.
+        self.dedup_threshold = dedup_threshold
+        # Rows are L2-normalized embeddings: float32, or int8 codes scaled by
+        # self._scales when quantized. Row i belongs to self.chunks[self._row_ids[i]];
+        # chunks without an embedding have no row. Stays None in basic mode, when
+        # no embeddings are available.
+        self._matrix = None
+        self._scales = None
+        self._row_ids = None
+        # FAISS index over self._matrix, built lazily on the first search after an insert
+        self._index = None
         self.chunks = []
         self.metadata = []
-    
+        # Lowercased chunk contents for the basic text search, computed once at insert time
+        self.content_lower = []
+
     def add_chunks(self, chunks: List[Dict[str, Any]], embeddings: List[List[float]]):
         """Add chunks and their embeddings to the store"""
-        # Handle case where embeddings list is empty (basic mode)
+        # In basic mode there are no embeddings; the chunks are kept for text search only
         if not embeddings:
-            for chunk in chunks:
-                self.chunks.append(chunk)
-                # Add a placeholder embedding for chunks without embeddings
-                self.embeddings.append([0.0] * 1536)  # OpenAI embedding dimension
-                self.metadata.append(chunk.get('metadata', {}))
+            embeddings = [None] * len(chunks)
+
+        # Normalize once here so neither deduplication nor search has to compute row norms
+        vectors = [e for e in embeddings if e]
+        block = normalize_rows(np.array(vectors, dtype=np.float32)) if vectors else None
+
+        if block is not None:
+            stored_dup, batch_dup = self._find_duplicates(block)
+
+        kept = []
+        row_ids = []
+        # Chunk index of each kept row of this block
+        row_chunk = {}
+        r = -1
+        for chunk, embedding in zip(chunks, embeddings):
+            if embedding:
+                r += 1
+                if stored_dup[r] >= 0:
+                    self._merge_chunk(int(stored_dup[r]), chunk)
+                    continue
+                if batch_dup[r] >= 0:
+                    self._merge_chunk(row_chunk[int(batch_dup[r])], chunk)
+                    continue
+                kept.append(r)
+                row_chunk[r] = len(self.chunks)
+                row_ids.append(len(self.chunks))
+            self.chunks.append(chunk)
+            self.metadata.append(chunk.get('metadata', {}))
+            self.content_lower.append(chunk['content'].lower())
+
+        if not kept:
+            return
+
+        block = block[kept]
+        if self.quantize:
+            block, scales = quantize_int8(block)
+            self._scales = scales if self._scales is None else np.concatenate([self._scales, scales])
+
+        row_ids = np.array(row_ids, dtype=np.intp)
+        if self._matrix is None:
+            self._matrix = block
+            self._row_ids = row_ids
         else:
-            # Normal case with embeddings
-            for chunk, embedding in zip(chunks, embeddings):
-                self.chunks.append(chunk)
-                if embedding:
-                    self.embeddings.append(embedding)
-                else:
-                    # Add a placeholder embedding for chunks without embeddings
-                    self.embeddings.append([0.0] * 1536)  # OpenAI embedding dimension
-                self.metadata.append(chunk.get('metadata', {}))
-    
+            self._matrix = np.concatenate([self._matrix, block])
+            self._row_ids = np.concatenate([self._row_ids, row_ids])
+        self._index = None
+
+    def _find_duplicates(self, block: np.ndarray):
+        """Find rows of a normalized block that duplicate a stored row or an earlier row of the block.
+
+        Returns two arrays with one entry per row: the chunk index of the stored
+        duplicate, and the index of the earlier block row it duplicates; -1 where
+        there is none. Similarities are computed as tiled matrix products.
+        """
+        n = len(block)
+        stored_dup = np.full(n, -1, dtype=np.intp)
+        batch_dup = np.full(n, -1, dtype=np.intp)
+        if self.dedup_threshold is None:
+            return stored_dup, batch_dup
+
+        if self._has_embeddings:
+            stored_rows = (self._float_rows(start, start + DEDUP_BLOCK)
+                           for start in range(0, len(self._matrix), DEDUP_BLOCK))
+            best, best_row = _best_matches(stored_rows, block)
+            hit = best > self.dedup_threshold
+            stored_dup[hit] = self._row_ids[best_row[hit]]
+
+        # Rows of earlier tiles that were kept, and their indices into block
+        kept_rows = []
+        kept_ids = np.empty(0, dtype=np.intp)
+        for start in range(0, n, DEDUP_BLOCK):
+            tile = block[start:start + DEDUP_BLOCK]
+            rows = np.arange(start, start + len(tile))
+
+            # Rows matching a stored row or a kept row of an earlier tile
+            best, best_pos = _best_matches(kept_rows, tile)
+            stored_hit = stored_dup[rows] >= 0
+            earlier_hit = ~stored_hit & (best > self.dedup_threshold)
+            batch_dup[rows[earlier_hit]] = kept_ids[best_pos[earlier_hit]]
+            is_kept = ~(stored_hit | earlier_hit)
+
+            # Within the tile, only rows similar to an earlier row of the tile need a
+            # sequential check, since it depends on whether that earlier row was kept
+            similar = np.tril(tile @ tile.T, -1) > self.dedup_threshold
+            for i in np.flatnonzero(is_kept & similar.any(axis=1)):
+                matches = np.flatnonzero(similar[i, :i] & is_kept[:i])
+                if len(matches):
+                    batch_dup[start + i] = start + matches[0]
+                    is_kept[i] = False
+
+            if is_kept.any():
+                kept_rows.append(tile[is_kept])
+                kept_ids = np.concatenate([kept_ids, rows[is_kept]])
+
+        return stored_dup, batch_dup
+
+    def _merge_chunk(self, idx: int, chunk: Dict[str, Any]):
+        """Merge a near-duplicate chunk into the stored chunk at idx.
+
+        The stored chunk keeps its own content, offsets and embedding row. The
+        duplicate's source is added to its 'sources', and metadata keys it lacks
+        are taken from the duplicate.
+        """
+        existing = self.chunks[idx]
+        sources = existing.setdefault('sources', [existing['source']])
+        if chunk['source'] not in sources:
+            sources.append(chunk['source'])
+
+        # Chunks of a document share its metadata dict, so build a new one
+        metadata = {**chunk.get('metadata', {}), **self.metadata[idx]}
+        existing['metadata'] = self.metadata[idx] = metadata
+
+    @property
+    def _has_embeddings(self) -> bool:
+        """Whether any chunk has an embedding to search"""
+        return self._matrix is not None
+
+    def save(self, path: str):
+        """Save the store to files starting with `path`.
+
+        The embedding matrix goes to its own .npy file so load() can memory-map it.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path + '.pkl', 'wb') as f:
+            pickle.dump({
+                'chunks': self.chunks,
+                'metadata': self.metadata,
+                'row_ids': self._row_ids,
+                'quantize': self.quantize,
+            }, f)
+
+        for suffix in ('.npy', '.scales.npy', '.faiss'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        if self._matrix is not None:
+            np.save(path + '.npy', self._matrix)
+        if self._scales is not None:
+            np.save(path + '.scales.npy', self._scales)
+        if self._index is not None:
+            faiss.write_index(self._index, path + '.faiss')
+
+    def load(self, path: str):
+        """Load a store saved with save(), replacing the current contents.
+
+        The embedding matrix is memory-mapped read-only, so rows are only read
+        from disk as searches touch them.
+        """
+        with open(path + '.pkl', 'rb') as f:
+            state = pickle.load(f)
+        self.chunks = state['chunks']
+        self.metadata = state['metadata']
+        self.content_lower = [chunk['content'].lower() for chunk in self.chunks]
+        self._row_ids = state['row_ids']
+        self.quantize = state['quantize']
+
+        self._matrix = np.load(path + '.npy', mmap_mode='r') if os.path.exists(path + '.npy') else None
+        self._scales = np.load(path + '.scales.npy') if os.path.exists(path + '.scales.npy') else None
+        self._index = faiss.read_index(path + '.faiss') if _HAS_FAISS and os.path.exists(path + '.faiss') else None
+
+        if self.quantize and not _HAS_SIMSIMD:
+            # int8 search needs SimSIMD; fall back to float32 rows in memory
+            if self._matrix is not None:
+                self._matrix = self._matrix.astype(np.float32) * self._scales[:, None]
+            self._scales = None
+            self.quantize = False
+            self._index = None
+
     def search(self, query_embedding: List[float], top_k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
         """Search for most similar chunks"""
-        if not self.embeddings:
+        if not self._has_embeddings or top_k <= 0:
+            return []
+
+        q = normalize(query_embedding)
+        if not q.any():
             return []
-        
-        # Calculate similarities
-        similarities = []
-        for embedding in self.embeddings:
-            sim = self._cosine_similarity(query_embedding, embedding)
-            similarities.append(sim)
-        
-        # Get top-k indices
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
-        
+
+        if _HAS_FAISS and len(self._matrix) >= FAISS_MIN_CHUNKS:
+            return self._search_index(q, top_k)
+
+        similarities = self._similarities(q)
+        top_indices = top_k_indices(similarities, top_k)
+
         # Return chunks with their similarity scores
         results = []
         for idx in top_indices:
             if similarities[idx] > 0:  # Only return relevant results
-                results.append((self.chunks[idx], similarities[idx]))
-        
+                results.append((self.chunks[self._row_ids[idx]], float(similarities[idx])))
+
         return results
-    
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """Calculate cosine similarity between two vectors"""
-        vec1 = np.array(vec1)
-        vec2 = np.array(vec2)
-        
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
-        
-        if norm1 == 0 or norm2 == 0:
-            return 0
-        
-        return dot_product / (norm1 * norm2)
\ No newline at end of file
+
+    def _similarities(self, q: np.ndarray) -> np.ndarray:
+        """Cosine similarity between a normalized vector and every stored row"""
+        if self.quantize:
+            return int8_cosine_similarities(q, self._matrix, self._scales)
+        return cosine_similarities(q, self._matrix)
+
+    def _search_index(self, q: np.ndarray, top_k: int) -> List[Tuple[Dict[str, Any], float]]:
+        """Search with a FAISS index; rows are normalized, so inner product is cosine similarity"""
+        if self._index is None:
+            self._index = self._build_index()
+
+        scores, indices = self._index.search(q[None, :], top_k)
+        return [
+            (self.chunks[self._row_ids[idx]], float(score))
+            for score, idx in zip(scores[0], indices[0])
+            if idx >= 0 and score > 0  # Only return relevant results
+        ]
+
+    def _build_index(self):
+        """Build a FAISS index over the embedding matrix, sized to the number of chunks"""
+        n, dim = self._matrix.shape
+        if self.quantize:
+            # Keep the index at 8 bits per dimension too
+            sq8 = faiss.ScalarQuantizer.QT_8bit
+            if n < HNSW_MIN_CHUNKS:
+                index = faiss.IndexScalarQuantizer(dim, sq8, faiss.METRIC_INNER_PRODUCT)
+            else:
+                index = faiss.IndexHNSWSQ(dim, sq8, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        elif n < HNSW_MIN_CHUNKS:
+            index = faiss.IndexFlatIP(dim)
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        if n >= HNSW_MIN_CHUNKS:
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+
+        if not index.is_trained:
+            index.train(self._float_rows(0, min(n, FAISS_ADD_BLOCK * 10)))
+        for start in range(0, n, FAISS_ADD_BLOCK):
+            index.add(self._float_rows(start, start + FAISS_ADD_BLOCK))
+        return index
+
+    def _float_rows(self, start: int, end: int) -> np.ndarray:
+        """Return rows of the matrix as contiguous float32, dequantizing if needed"""
+        rows = self._matrix[start:end]
+        if self.quantize:
+            return rows.astype(np.float32) * self._scales[start:end, None]
+        return np.ascontiguousarray(rows)